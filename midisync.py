@@ -12,82 +12,407 @@ takes in a MIDI file and a video clip, and creates a video with the clip synced
 - output video has no audio (add separately in editor).
 '''
 
+import os
 import sys
-import mido
+import functools
+import concurrent.futures
+import subprocess
+import tempfile
 import numpy
-from moviepy.editor import VideoFileClip, concatenate_videoclips, ColorClip
+from moviepy.config import get_setting
+from moviepy.editor import VideoFileClip
 
-def extractNotes(filePath, chordThreshold=0.1) :
+# use the same ffmpeg binary as moviepy
+FFMPEG_BINARY = get_setting("FFMPEG_BINARY")
+
+# event kinds used when flattening MIDI tracks into arrays
+OTHER, NOTE_ON, NOTE_OFF, SET_TEMPO = 0, 1, 2, 3
+
+# MIDI default tempo (microseconds per beat) before any set_tempo event
+DEFAULT_TEMPO = 500000
+
+# segment variants in the output timeline. a clip variant is the sum of its flag bits
+# (0 is the clip played forward), and green screen comes after the four clip variants
+CLIP_BACKWARD, CLIP_FLIPPED, GREEN = 1, 2, 4
+
+# number of data bytes after each system status byte (meta and sysex have their own length)
+SYSTEM_DATA_LENGTHS = {0xf1 : 1, 0xf2 : 2, 0xf3 : 1, 0xf6 : 0, 0xf8 : 0, 0xfa : 0, 0xfb : 0, 0xfc : 0, 0xfe : 0}
+
+def readVariableInt(data, pos) :
+    '''
+    read a MIDI variable-length quantity (7 bits per byte, high bit set on all but the last).
+    
+    args:
+        data: bytes of the MIDI file
+        pos: index of the first byte
+    
+    returns the value and the index of the byte after it.
+    '''
+
+    value = 0
+    
+    while True :
+        byte = data[pos]
+        pos += 1
+        value = (value << 7) | (byte & 0x7f)
+        
+        if byte < 0x80 :
+            return value, pos
+
+def readTrack(data, start, end) :
+    '''
+    flatten one MTrk chunk into an array in a single pass over its bytes.
+    end_of_track is left out, the same as when mido merges tracks.
+    
+    args:
+        data: bytes of the MIDI file
+        start: index of the first event of the track
+        end: index after the last byte of the track
+    
+    returns int64 array with one row per event: absolute tick, kind, note, tempo.
+    '''
+
+    rows = []
+    tick = 0
+    lastStatus = None
+    pos = start
+    
+    while pos < end :
+        delta, pos = readVariableInt(data, pos)
+        tick += delta
+        status = data[pos]
+        
+        # running status, the status byte is left out and this is already a data byte
+        if status < 0x80 :
+            if lastStatus is None :
+                raise OSError('running status without last_status')
+            status = lastStatus
+        else :
+            pos += 1
+            
+            # meta events don't change running status, everything else does
+            if status != 0xff :
+                lastStatus = status
+        
+        if status == 0xff :
+            metaType = data[pos]
+            length, pos = readVariableInt(data, pos + 1)
+            
+            if metaType == 0x51 :
+                rows.append((tick, SET_TEMPO, 0, int.from_bytes(data[pos:pos + 3], 'big')))
+            elif metaType != 0x2f :
+                rows.append((tick, OTHER, 0, 0))
+            
+            pos += length
+        
+        elif status == 0xf0 or status == 0xf7 :
+            length, pos = readVariableInt(data, pos)
+            rows.append((tick, OTHER, 0, 0))
+            pos += length
+        
+        elif status < 0xf0 :
+            command = status & 0xf0
+            
+            if command == 0x90 and data[pos + 1] > 0 :
+                rows.append((tick, NOTE_ON, data[pos], 0))
+            elif command == 0x80 or command == 0x90 :
+                rows.append((tick, NOTE_OFF, data[pos], 0))
+            else :
+                rows.append((tick, OTHER, 0, 0))
+            
+            # program change and channel pressure have one data byte, the rest have two
+            pos += 1 if command == 0xc0 or command == 0xd0 else 2
+        
+        elif status in SYSTEM_DATA_LENGTHS :
+            rows.append((tick, OTHER, 0, 0))
+            pos += SYSTEM_DATA_LENGTHS[status]
+        
+        else :
+            raise OSError(f'undefined status byte 0x{status :02x}')
+    
+    return numpy.array(rows, dtype=numpy.int64).reshape(-1, 4)
+
+def readMidi(filePath) :
+    '''
+    read the tracks of a standard MIDI file into event arrays.
+    parses the file's bytes directly instead of building a mido message per event.
+    
+    args:
+        filePath: path to the MIDI file
+    
+    returns ticks per beat and a list with one event array per track (see readTrack).
+    '''
+
+    with open(filePath, 'rb') as midiFile :
+        data = midiFile.read()
+    
+    if data[:4] != b'MThd' :
+        raise OSError('MThd not found. Probably not a MIDI file')
+    
+    headerSize = int.from_bytes(data[4:8], 'big')
+    numTracks = int.from_bytes(data[10:12], 'big')
+    ticksPerBeat = int.from_bytes(data[12:14], 'big', signed=True)
+    
+    # walk the chunks after the header, skipping any that aren't tracks
+    tracks = []
+    pos = 8 + headerSize
+    
+    while len(tracks) < numTracks and pos + 8 <= len(data) :
+        chunkType = data[pos:pos + 4]
+        chunkSize = int.from_bytes(data[pos + 4:pos + 8], 'big')
+        pos += 8
+        
+        if chunkType == b'MTrk' :
+            tracks.append(readTrack(data, pos, min(pos + chunkSize, len(data))))
+        
+        pos += chunkSize
+    
+    return ticksPerBeat, tracks
+
+def ticksToSeconds(ticks, kinds, tempos, ticksPerBeat) :
+    '''
+    convert the absolute ticks of merged, tick-ordered events to seconds.
+    each gap between events is converted at the tempo in effect and summed in order,
+    the same way mido times messages, so note times match it exactly.
+    
+    args:
+        ticks: sorted array of absolute ticks
+        kinds: event kind of each tick
+        tempos: microseconds per beat of each set_tempo event
+        ticksPerBeat: MIDI file resolution
+    
+    returns float array of times in seconds.
     '''
-    extract note timings from a MIDI file and return as a list.
+
+    # tempo of the gap before each event, set by the last set_tempo event before it
+    lastTempo = numpy.maximum.accumulate(numpy.where(kinds == SET_TEMPO, numpy.arange(len(ticks)), -1))
+    usPerBeat = numpy.where(lastTempo >= 0, tempos[lastTempo], DEFAULT_TEMPO)
+    usPerBeat = numpy.concatenate(([DEFAULT_TEMPO], usPerBeat[:-1]))
+    
+    return numpy.cumsum(numpy.diff(ticks, prepend=0) * (usPerBeat * 1e-6 / ticksPerBeat))
+
+def extractNotes(filePath, chordThreshold=0.1, verbose=False) :
+    '''
+    extract note timings from a MIDI file and return as arrays.
     notes starting within chordThreshold seconds are grouped with the same number.
     
     args:
         filePath: path to the input MIDI file
         chordThreshold: time window in seconds to group notes as chords (default: 0.1)
+        verbose: print the timings of every note/chord event (default: False)
     
-    returns list of note events with noteNum, startTime, and endTime.
+    returns parallel arrays of start times, end times, and note numbers.
     '''
 
     # load the MIDI file
-    mid = mido.MidiFile(filePath)
+    ticksPerBeat, tracks = readMidi(filePath)
+    
+    # merge all tracks into one array ordered by tick (stable, so track order breaks ties)
+    events = numpy.concatenate(tracks or [numpy.empty((0, 4), dtype=numpy.int64)])
+    events = events[numpy.argsort(events[:, 0], kind='stable')]
+    ticks, kinds, notes, tempos = events.T
+    
+    # convert every event time to seconds in one go
+    seconds = ticksToSeconds(ticks, kinds, tempos, ticksPerBeat)
     
-    # track note events with their timings
-    noteEvents = []
-    currentTime = 0.0
+    # pair each note off with the note on right before it of the same pitch.
+    # sorting by pitch (stable) keeps events of a pitch in playback order, so an
+    # off directly after an on closes it and an off after another off is ignored
+    noteIdx = numpy.flatnonzero((kinds == NOTE_ON) | (kinds == NOTE_OFF))
+    noteIdx = noteIdx[numpy.argsort(notes[noteIdx], kind='stable')]
+    pitchIdx = notes[noteIdx]
+    onIdx, offIdx = noteIdx[:-1], noteIdx[1:]
+    isPair = (kinds[onIdx] == NOTE_ON) & (kinds[offIdx] == NOTE_OFF) & (pitchIdx[:-1] == pitchIdx[1:])
+    onIdx, offIdx = onIdx[isPair], offIdx[isPair]
     
-    # dict to track when each note was turned on
-    activeNotes = {}
+    # sort by start time, notes starting together stay in the order they ended
+    order = numpy.lexsort((offIdx, seconds[onIdx]))
+    starts = seconds[onIdx[order]]
+    ends = seconds[offIdx[order]]
     
-    # process all messages in the MIDI file
-    for msg in mid :
-        currentTime += msg.time
+    # find the first note of each chord. a note joins the chord if it starts within
+    # chordThreshold of the chord's first note, not of the previous note, so this
+    # can't be a plain diff of starts (that would chain arpeggios into one chord).
+    # a binary search jumps straight to the next chord instead of visiting every note
+    numNotes = len(starts)
+    startTimes = starts.tolist()
+    firstIdx = []
+    i = 0
+    
+    while i < numNotes :
+        firstIdx.append(i)
+        lastStartTime = startTimes[i]
+        i = max(int(numpy.searchsorted(starts, lastStartTime + chordThreshold, side='right')), i + 1)
         
-        if msg.type == 'note_on' and msg.velocity > 0 :
-            activeNotes[msg.note] = currentTime
-            
-        elif msg.type == 'note_off' or (msg.type == 'note_on' and msg.velocity == 0) :
-            if msg.note in activeNotes :
-                startTime = activeNotes[msg.note]
-                endTime = currentTime
-                noteEvents.append({
-                    'pitch' : msg.note,
-                    'start' : startTime,
-                    'end' : endTime
-                })
-                del activeNotes[msg.note]
-    
-    # sort by start time
-    noteEvents.sort(key=lambda x : x['start'])
-    
-    # assign note numbers, grouping chords together
-    noteNum = 0
-    lastStartTime = None
-    groupedEvents = []
-    
-    for event in noteEvents :
-        if lastStartTime is None or (event['start'] - lastStartTime) > chordThreshold :
-            noteNum += 1
-            lastStartTime = event['start']
-            groupedEvents.append({
-                'noteNum' : noteNum,
-                'start' : event['start'],
-                'end' : event['end']
-            })
+        # the search compares against a rounded sum, so fix up float error at the edge
+        while i - 1 > firstIdx[-1] and (startTimes[i - 1] - lastStartTime) > chordThreshold :
+            i -= 1
+        while i < numNotes and not (startTimes[i] - lastStartTime) > chordThreshold :
+            i += 1
+    
+    # keep one event per note/chord, numbered from 1
+    starts, ends = starts[firstIdx], ends[firstIdx]
+    noteNums = numpy.arange(1, len(starts) + 1)
     
     print()
     print(f"MIDI file path: {filePath}")
-    print(f"Extracted {len(noteEvents)} notes")
-    print(f"Grouped into {noteNum} note/chord events")
-    print()
-    print("Note #, Start, End")
+    print(f"Extracted {numNotes} notes")
+    print(f"Grouped into {len(noteNums)} note/chord events")
     
-    for event in groupedEvents :
-        print(f"{event['noteNum']}, {event['start'] :.3f}, {event['end'] :.3f}")
+    # print the whole table in one write, it can be thousands of lines
+    if verbose :
+        print()
+        sys.stdout.write("Note #, Start, End\n" + "".join(
+            f"{noteNum}, {startTime :.3f}, {endTime :.3f}\n"
+            for noteNum, startTime, endTime in zip(noteNums.tolist(), starts.tolist(), ends.tolist())
+        ))
     
-    return groupedEvents
+    return starts, ends, noteNums
 
-def createVideo(midiPath, videoClipPath, outputPath) :
+def physicalMemory() :
+    '''
+    get the total physical memory of this machine.
+    
+    returns the memory in bytes, or None if the system doesn't report it.
+    '''
+    
+    try :
+        return os.sysconf('SC_PAGE_SIZE') * os.sysconf('SC_PHYS_PAGES')
+    except (AttributeError, ValueError, OSError) :
+        return None
+
+def runFFmpeg(args) :
+    '''
+    run ffmpeg with the given arguments, raising an error if it fails.
+    
+    args:
+        args: list of command-line arguments (without the ffmpeg binary)
+    '''
+
+    subprocess.run([FFMPEG_BINARY, '-y', '-loglevel', 'error'] + args, check=True)
+
+def renderSegment(segmentPath, numFrames, fps, size, frames=None, threads=0, preset='veryfast') :
+    '''
+    render one segment of the output video to its own file.
+    segments all use the same encoder settings so they can be joined without re-encoding.
+    
+    args:
+        segmentPath: path to save the segment
+        numFrames: length of the segment in frames
+        fps: frame rate of the segment
+        size: (width, height) of the segment
+        frames: RGB frames to encode (any numpy view works), or None for green screen
+        threads: number of libx264 encoder threads, 0 lets x264 decide (default: 0)
+        preset: libx264 speed preset (default: veryfast)
+    '''
+
+    width, height = size
+    
+    if frames is None :
+        # green screen generated by ffmpeg (chroma key green: RGB 0, 255, 0)
+        inputArgs = ['-f', 'lavfi', '-i', f'color=c=0x00FF00:s={width}x{height}:r={fps}']
+    else :
+        # raw frames piped in from the already decoded source
+        inputArgs = ['-f', 'rawvideo', '-pix_fmt', 'rgb24', '-s', f'{width}x{height}', '-r', str(fps), '-i', '-']
+    
+    # yuv420p needs even dimensions, same as moviepy's writer
+    pixelFormat = 'yuv420p' if width % 2 == 0 and height % 2 == 0 else 'yuv444p'
+    
+    args = inputArgs + [
+        '-frames:v', str(numFrames),
+        '-an',
+        '-c:v', 'libx264',
+        '-preset', preset,
+        '-threads', str(threads),
+        # frame-based threading, which has better throughput than slices
+        '-x264-params', 'sliced-threads=0',
+        # no B-frames, so every frame only depends on earlier ones and the segment
+        # can be cut short at any frame without re-encoding
+        '-bf', '0',
+        '-pix_fmt', pixelFormat,
+        segmentPath
+    ]
+    
+    if frames is None :
+        runFFmpeg(args)
+        return
+    
+    command = [FFMPEG_BINARY, '-y', '-loglevel', 'error'] + args
+    encoder = subprocess.Popen(command, stdin=subprocess.PIPE)
+    
+    frames = frames[:numFrames]
+    pipeBroken = False
+    
+    try :
+        if frames[0].flags.c_contiguous :
+            # forward and backward frames go straight from the array into the pipe, no copies
+            for frame in frames :
+                encoder.stdin.write(frame)
+        else :
+            # flipped frames are a strided view, copy them a block (~64MB) at a time so it's
+            # one vectorized copy per block instead of one per frame
+            blockFrames = max(1, (64 << 20) // frames[0].nbytes)
+            
+            for i in range(0, numFrames, blockFrames) :
+                encoder.stdin.write(numpy.ascontiguousarray(frames[i:i + blockFrames]))
+    except BrokenPipeError :
+        # the encoder quit before reading every frame, reported below like any ffmpeg failure
+        pipeBroken = True
+    finally :
+        # always close the pipe and wait for the encoder, even if writing failed
+        try :
+            encoder.stdin.close()
+        except BrokenPipeError :
+            pipeBroken = True
+        
+        encoder.wait()
+    
+    if pipeBroken or encoder.returncode != 0 :
+        raise subprocess.CalledProcessError(encoder.returncode, command)
+
+def layoutTimeline(startFrames, endFrames, noteNums, sourceFrames) :
+    '''
+    lay out the output video as a sequence of segment cuts, for all notes at once.
+    each note is a green gap (if there's silence before it), then the clip in pieces of at
+    most sourceFrames that alternate forward and backward, so a note longer than the clip
+    bounces and a shorter one is a single trimmed piece.
+    
+    args:
+        startFrames: output frame each note starts on
+        endFrames: output frame each note ends on
+        noteNums: note/chord numbers, even ones are flipped
+        sourceFrames: number of decoded source clip frames
+    
+    returns parallel arrays of segment variant (CLIP_... flag bits or GREEN) and frames played.
+    '''
+
+    gapFrames = startFrames - numpy.concatenate(([0], endFrames[:-1]))
+    noteFrames = endFrames - startFrames
+    hasGap = gapFrames > 0
+    numPieces = -(-noteFrames // sourceFrames)
+    
+    # index of each note's first entry (its gap, or its first piece)
+    numEntries = hasGap + numPieces
+    firstEntry = numpy.cumsum(numEntries) - numEntries
+    
+    variants = numpy.empty(int(numEntries.sum()), dtype=numpy.int64)
+    entryFrames = numpy.empty_like(variants)
+    
+    variants[firstEntry[hasGap]] = GREEN
+    entryFrames[firstEntry[hasGap]] = gapFrames[hasGap]
+    
+    # every piece of every note, numbered from 0 within its note
+    pieceNote = numpy.repeat(numpy.arange(len(noteFrames)), numPieces)
+    pieceNum = numpy.arange(len(pieceNote)) - numpy.repeat(numpy.cumsum(numPieces) - numPieces, numPieces)
+    pieceEntry = firstEntry[pieceNote] + hasGap[pieceNote] + pieceNum
+    
+    # flip horizontally for even-numbered notes, odd pieces play backward
+    variants[pieceEntry] = (noteNums[pieceNote] % 2 == 0) * CLIP_FLIPPED + pieceNum % 2 * CLIP_BACKWARD
+    entryFrames[pieceEntry] = numpy.minimum(noteFrames[pieceNote] - pieceNum * sourceFrames, sourceFrames)
+    
+    return variants, entryFrames
+
+def createVideo(midiPath, videoClipPath, outputPath, threads=os.cpu_count() or 0, preset='veryfast', verbose=False) :
     '''
     create a video based on MIDI timings using a source video clip.
     
@@ -95,106 +420,157 @@ def createVideo(midiPath, videoClipPath, outputPath) :
         midiPath: Path to the input MIDI file
         videoClipPath: Path to the video clip to use for each note
         outputPath: Path to save the output video
+        threads: number of CPU threads to encode with (default: number of CPUs)
+        preset: libx264 speed preset (default: veryfast)
+        verbose: print the timings of every note/chord event (default: False)
     '''
 
     # extract note timings with default chord threshold of 0.1
-    noteEvents = extractNotes(midiPath, chordThreshold=0.1)
+    starts, ends, noteNums = extractNotes(midiPath, chordThreshold=0.1, verbose=verbose)
     
-    if not noteEvents :
+    if not len(noteNums) :
         print("No notes found :(")
         return
     
-    # load the source video clip
+    # output video uses default fps of 30
+    fps = 30
+    
+    # timings are snapped to the first output frame at or after them, so segment lengths
+    # can't drift from the MIDI over a long song
+    # (small tolerance so float error doesn't push exact frame times a frame later)
+    startFrames = numpy.ceil(starts * fps - 1e-6).astype(numpy.int64)
+    endFrames = numpy.ceil(ends * fps - 1e-6).astype(numpy.int64)
+    
+    # decode the source video clip once at the output frame rate. one reader goes
+    # through the clip in order and every segment is a view of these frames.
+    # frames are written straight into one buffer (the encoder threads all share it),
+    # so the clip is never held in memory twice
     sourceClip = VideoFileClip(videoClipPath)
+    size = (sourceClip.w, sourceClip.h)
+    frameTimes = numpy.arange(0, sourceClip.duration, 1.0 / fps)
+    
+    # a note that fits in the clip only plays it from the start for the note's length,
+    # and only a note longer than the clip bounces through all of it, so there's no
+    # need to decode past the longest note
+    frameTimes = frameTimes[:max(1, int((endFrames - startFrames).max()))]
     
-    # build the complete video timeline
-    videoClips = []
-    currentPos = 0.0
+    # the buffer has to fit in memory, leave the other half for ffmpeg and the system
+    bufferBytes = len(frameTimes) * sourceClip.h * sourceClip.w * 3
+    totalMemory = physicalMemory()
     
-    for event in noteEvents :
-        noteNum = event['noteNum']
-        startTime = event['start']
-        endTime = event['end']
-        duration = endTime - startTime
+    if totalMemory and bufferBytes > totalMemory // 2 :
+        sourceClip.close()
+        raise MemoryError(
+            f"Decoding {len(frameTimes)} frames of {sourceClip.w}x{sourceClip.h} video needs "
+            f"{bufferBytes / 2**30 :.1f} GB, more than half of this machine's "
+            f"{totalMemory / 2**30 :.1f} GB of memory. Use a shorter or lower resolution clip."
+        )
+    
+    frames = numpy.empty((len(frameTimes), sourceClip.h, sourceClip.w, 3), dtype=numpy.uint8)
+    
+    for i, t in enumerate(frameTimes) :
+        frames[i] = sourceClip.get_frame(t)
+    
+    sourceClip.close()
+    sourceFrames = len(frames)
+    
+    # build the complete video timeline as a list of segment cuts
+    variants, entryFrames = layoutTimeline(startFrames, endFrames, noteNums, sourceFrames)
+    
+    # notes that are all zero frames long at the very start leave nothing to render
+    if not len(variants) :
+        print("No notes found :(")
+        return
+    
+    # segment key (numFrames, green, flipped, backward) of each variant. notes are cut from
+    # the decoded clip and gaps all cut one green segment as long as the longest gap
+    gapFrames = entryFrames[variants == GREEN]
+    segmentKeys = [(sourceFrames, False, flipped, backward) for flipped in (False, True) for backward in (False, True)]
+    segmentKeys.append((int(gapFrames.max()) if len(gapFrames) else 1, True, False, False))
+    
+    # each segment is independent, so render them side by side with the CPU threads
+    # split between encoders. threads are enough since the work happens in ffmpeg
+    uniqueSegments = [segmentKeys[variant] for variant in numpy.unique(variants).tolist()]
+    cpus = threads or os.cpu_count() or 1
+    workers = max(1, min(cpus, len(uniqueSegments)))
+    
+    with tempfile.TemporaryDirectory() as tempDir :
         
-        # add gap if there's silence before this note
-        if startTime > currentPos :
-            gapDuration = startTime - currentPos
+        # render each segment once. notes are whole frames long and always start at the
+        # clip's first (or last) frame, so they're all cuts of at most four full-length
+        # clip segments, plus the green one
+        @functools.lru_cache(maxsize=None)
+        def segment(numFrames, green=False, flipped=False, backward=False) :
+            name = 'green' if green else 'clip' + ('_flipped' if flipped else '') + ('_backward' if backward else '')
+            segmentPath = os.path.join(tempDir, f"{name}_{numFrames}.mp4")
             
-            # Create a green screen clip (chroma key green: RGB 0, 255, 0)
-            greenClip = ColorClip(
-                size=(sourceClip.w, sourceClip.h),
-                color=(0, 255, 0),
-                duration=gapDuration
-            )
-            videoClips.append(greenClip)
-        
-        # create clip for this note
-        # if clip is too short, bounce it (forward then backward)
-        # if too long, trim it
-        if sourceClip.duration < duration :
-            # create bouncing effect by alternating forward and reversed clips
-            clips = []
-            remainingDuration = duration
-            forward = True
+            # flipped and reversed clips are just strided views of the decoded frames
+            if green :
+                clipFrames = None
+            else :
+                clipFrames = frames[::-1] if backward else frames
+                clipFrames = clipFrames[:, :, ::-1] if flipped else clipFrames
             
-            while remainingDuration > 0 :
-                clipDuration = min(remainingDuration, sourceClip.duration)
-                
-                if forward :
-                    clipToAdd = sourceClip.subclip(0, clipDuration)
-                else :
-                    # Create reversed clip by reversing frame indices
-                    clipToAdd = sourceClip.subclip(0, clipDuration).fx(
-                        lambda clip: clip.fl_time(lambda t: clipDuration - t - 1.0/clip.fps, apply_to=['video', 'audio'])
-                    ).set_duration(clipDuration)
-                
-                clips.append(clipToAdd)
-                remainingDuration -= clipDuration
-                forward = not forward
+            renderSegment(
+                segmentPath,
+                numFrames,
+                fps,
+                size,
+                frames=clipFrames,
+                threads=max(1, cpus // workers),
+                preset=preset
+            )
             
-            noteClip = concatenate_videoclips(clips)
-        else :
-            noteClip = sourceClip.subclip(0, duration)
+            return segmentPath
         
-        # flip horizontally for even-numbered notes
-        if noteNum % 2 == 0 :
-            noteClip = noteClip.fx(lambda clip : clip.fl_image(lambda img : numpy.fliplr(img)))
+        print(f"\nRendering {len(uniqueSegments)} segments with {workers} workers to {tempDir}")
         
-        videoClips.append(noteClip)
-        currentPos = endTime
-    
-    # concatenate all clips
-    print(f"\nCreating synced video with {len(videoClips)} clip segments (clips + silences)")
-    finalVideo = concatenate_videoclips(videoClips, method="compose")
+        with concurrent.futures.ThreadPoolExecutor(max_workers=workers) as executor :
+            list(executor.map(lambda key : segment(*key), uniqueSegments))
+        
+        # join all segments with ffmpeg's concat demuxer, copying instead of re-encoding
+        print(f"Creating synced video with {len(variants)} clip segments (clips + silences)")
+        
+        # the outpoint of a cut segment is also where the next segment starts, so it has to
+        # be the exact length played. round down to whole microseconds (ffmpeg's precision)
+        # so the frame right after the cut can't sneak in
+        paths = [segment(*key) if key in uniqueSegments else None for key in segmentKeys]
+        isCut = entryFrames < numpy.array([key[0] for key in segmentKeys])[variants]
+        outpoints = entryFrames * 1000000 // fps
+        
+        listPath = os.path.join(tempDir, "segments.txt")
+        
+        with open(listPath, 'w') as listFile :
+            listFile.writelines(
+                f"file '{paths[variant]}'\noutpoint {outpoint // 1000000}.{outpoint % 1000000 :06d}\n" if cut else
+                f"file '{paths[variant]}'\n"
+                for variant, outpoint, cut in zip(variants.tolist(), outpoints.tolist(), isCut.tolist())
+            )
+        
+        runFFmpeg(['-f', 'concat', '-safe', '0', '-i', listPath, '-c', 'copy', outputPath])
     
-    # write output video with default fps of 30
-    print()
-    finalVideo.write_videofile(
-        outputPath,
-        fps=30,
-        codec='libx264',
-        audio=False
-    )
-    
-    # clean up
-    sourceClip.close()
-    finalVideo.close()
+    print(f"Saved video to {outputPath}")
     print()
 
 if __name__ == "__main__" :
     
+    # -v/--verbose prints the timings of every note/chord event
+    verbose = '-v' in sys.argv[1:] or '--verbose' in sys.argv[1:]
+    args = [arg for arg in sys.argv[1:] if arg not in ('-v', '--verbose')]
+    
     # check if command-line arguments are provided
-    if len(sys.argv) == 4 :
-        midi_file = sys.argv[1]
-        video_clip = sys.argv[2]
-        output_video = sys.argv[3]
+    if len(args) == 3 :
+        midi_file = args[0]
+        video_clip = args[1]
+        output_video = args[2]
     else :
         print()
-        print("Usage: python3 midisync.py <midi_file> <video_clip> <output_video>")
+        print("Usage: python3 midisync.py [-v] <midi_file> <video_clip> <output_video>")
+        print("\nOptions:")
+        print("  -v, --verbose  print the start and end time of every note/chord event")
         print("\nExample:")
         print("  python3 midisync.py input.mid video.mp4 output.mp4")
         print()
         sys.exit(1)
     
-    createVideo(midi_file, video_clip, output_video)
\ No newline at end of file
+    createVideo(midi_file, video_clip, output_video, verbose=verbose)
\ No newline at end of file